@@ -1,4 +1,8 @@
+import glob
 import os
+import re
+import shutil
+import tempfile
 import numpy as np
 import signac
 from opmd_viewer import OpenPMDTimeSeries
@@ -24,17 +28,37 @@ job = pr.open_job(id=job_id)
 # get path to job's hdf5 files
 h5_path = os.path.join(job.ws, "diags", "hdf5")
 
-# open the full time series and see iteration numbers
-time_series = OpenPMDTimeSeries(h5_path, check_all_files=True)
-iteration = time_series.iterations[-1]
+# only the last iteration is needed, so pick its file by name instead of
+# letting OpenPMDTimeSeries open every .h5 file in the folder
+h5_iterations = {}
+for fn in glob.glob(os.path.join(h5_path, "data*.h5")):
+    match = re.fullmatch(r"data(\d+)\.h5", os.path.basename(fn))
+    if match:
+        h5_iterations[int(match.group(1))] = fn
+if not h5_iterations:
+    raise FileNotFoundError("No data*.h5 files found in %s" % h5_path)
+last_h5_file = h5_iterations[max(h5_iterations)]
 
-# compute 1D histogram
-energy_hist, bin_edges, nbins = particle_energy_histogram(
-    tseries=time_series,
-    it=iteration,
-    cutoff=np.inf,  # no cutoff
-)
+# reading the particles from disk is slow, so reuse the job's saved histogram,
+# unless the simulation wrote newer output since
+hist_file = job.fn('histogram.npz')
+if not os.path.isfile(hist_file) or os.path.getmtime(hist_file) < os.path.getmtime(last_h5_file):
+    with tempfile.TemporaryDirectory() as last_h5_dir:
+        os.symlink(last_h5_file, os.path.join(last_h5_dir, os.path.basename(last_h5_file)))
 
-print("%s/%s" % (iteration, job.sp.N_step))
-np.savez('histogram', edges=bin_edges, counts=energy_hist)
+        # open a time series containing just the last iteration
+        time_series = OpenPMDTimeSeries(last_h5_dir, check_all_files=False)
+        iteration = time_series.iterations[-1]
 
+        # compute 1D histogram
+        energy_hist, bin_edges, nbins = particle_energy_histogram(
+            tseries=time_series,
+            it=iteration,
+            cutoff=np.inf,  # no cutoff
+        )
+
+    print("%s/%s" % (iteration, job.sp.N_step))
+    np.savez(hist_file, edges=bin_edges, counts=energy_hist)
+
+# copy it next to this script, for peak_detection.py
+shutil.copy(hist_file, 'histogram.npz')
@@ -74,8 +74,9 @@ npzfile = np.load('histogram.npz')
 edges = npzfile['edges']
 counts = npzfile['counts']
 
-energy = np.array([edges[:-1], edges[1:]]).T.flatten()
-charge = np.array([counts, counts]).T.flatten()
+# step-plot axes: [e0, e1, e1, e2, ...] and [c0, c0, c1, c1, ...]
+energy = np.repeat(edges, 2)[1:-1]
+charge = np.repeat(counts, 2)
 
 mask = (energy > 90) & (energy < 710)  # MeV
 energy = energy[mask]
@@ -17,15 +17,16 @@ where fbpic_object is any of the objects or function of FBPIC.
 # -------
 # Imports
 # -------
+import os
+
 import numpy as np
 from fbpic.lpa_utils.laser import add_laser_pulse, GaussianLaser
 # Import the relevant structures in FBPIC
 from fbpic.main import Simulation
 from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic, \
     set_periodic_checkpoint, restart_from_checkpoint
-from matplotlib import pyplot
+from numba import njit, float64
 from scipy.constants import c, e, m_e
-from sliceplots import Plot2D
 
 # ----------
 # Parameters
@@ -82,23 +83,40 @@ save_checkpoints = False # Whether to write checkpoint files
 checkpoint_period = 200  # Period for writing the checkpoints
 use_restart = False      # Whether to restart from a previous checkpoint
 track_electrons = True  # Whether to track and write particle ids
+# Whether to plot the initial laser field to check_laser.png (MPI gather!)
+check_laser = bool(os.environ.get('FBPIC_CHECK_LASER'))
 
 # The density profile
 ramp_start = 0.e-6
 ramp_length = 375.e-6
 
 
-def dens_func( z, r ) :
-    """Returns relative density at position z and r"""
+# Compiled once and cached on disk: FBPIC calls dens_func for every injected slab
+@njit( float64[:](float64[:]), cache=True, fastmath=True )
+def _relative_density( z ) :
+    """Single pass over z, writing the relative density without temporaries"""
     # Allocate relative density
-    n = np.ones_like(z)
-    # Make linear ramp
-    n = np.where( z<ramp_start+ramp_length, (z-ramp_start)/ramp_length, n )
-    # Supress density before the ramp
-    n = np.where( z<ramp_start, 0., n )
+    n = np.empty_like(z)
+    for i in range(z.shape[0]):
+        zi = z[i]
+        if zi < ramp_start:
+            # Supress density before the ramp
+            n[i] = 0.
+        elif zi < ramp_start+ramp_length:
+            # Make linear ramp
+            n[i] = (zi-ramp_start)/ramp_length
+        else:
+            n[i] = 1.
     return(n)
 
 
+def dens_func( z, r ) :
+    """Returns relative density at position z and r"""
+    # FBPIC inspects the arguments of dens_func and calls it with keywords,
+    # so the compiled kernel is kept behind a plain Python function
+    return _relative_density( np.asarray(z, dtype=np.float64) )
+
+
 # The interaction length of the simulation (meters)
 L_interact = 900.e-6 - (zmax - zmin)  # increase to simulate longer distance!
 
@@ -106,6 +124,9 @@ L_interact = 900.e-6 - (zmax - zmin)  # increase to simulate longer distance!
 T_interact = ( L_interact + (zmax-zmin) ) / v_window
 # (i.e. the time it takes for the moving window to slide across the plasma)
 
+# Number of iterations to perform
+N_step = int(T_interact/dt)
+
 # ---------------------------
 # Carrying out the simulation
 # ---------------------------
@@ -116,7 +137,7 @@ if __name__ == '__main__':
 
     # Initialize the simulation object
     sim = Simulation( Nz, zmax, Nr, rmax, Nm, dt, n_e=None, zmin=zmin,
-            boundaries={"z":"open", "r":"reflective"}, n_order=n_order, use_cuda=use_cuda, verbose_level=2, )
+            boundaries={"z":"open", "r":"reflective"}, n_order=n_order, use_cuda=use_cuda, verbose_level=1, )
 
     # Create a Gaussian laser profile
     laser_profile = GaussianLaser(a0=a0, waist=w0, tau=ctau / c, z0=z0,
@@ -144,57 +165,65 @@ if __name__ == '__main__':
     sim.set_moving_window( v=v_window )
 
     # Add diagnostics
-    sim.diags = [ FieldDiagnostic( diag_period, sim.fld, comm=sim.comm ),
+    sim.diags = [ FieldDiagnostic( diag_period, sim.fld,
+                    fieldtypes=["rho", "E"], comm=sim.comm ),
                   ParticleDiagnostic( diag_period, {"electrons" : elec},
                     select={"uz" : [1., None ]}, comm=sim.comm ) ]
     # Add checkpoints
     if save_checkpoints:
         set_periodic_checkpoint( sim, checkpoint_period )
 
-    # Number of iterations to perform
-    N_step = int(T_interact/sim.dt)
-
-    # Get the fields in the half-plane theta=0 (Sum mode 0 and mode 1)
-    gathered_grids = [sim.comm.gather_grid(sim.fld.interp[m]) for m in range(Nm)]
-
-    rgrid = gathered_grids[0].r
-    zgrid = gathered_grids[0].z
-
-    # Check the Er field
-    Er = gathered_grids[0].Er.T.real
-
-    for m in range(1, Nm):
-        # There is a factor 2 here so as to comply with the convention in
-        # Lifschitz et al., which is also the convention adopted in Warp Circ
-        Er += 2 * gathered_grids[m].Er.T.real
-
-    # wavevector
-    k0 = 2 * np.pi / lambda0
-    # field amplitude
-    e0 = m_e * c ** 2 * k0 / e
-
-    fig = pyplot.figure(figsize=(8, 8))
-    Plot2D(
-        fig=fig,
-        arr2d=Er / e0,
-        h_axis=zgrid * 1e6,
-        v_axis=rgrid * 1e6,
-        zlabel=r"$E_r/E_0$",
-        xlabel=r"$z \;(\mu m)$",
-        ylabel=r"$r \;(\mu m)$",
-        extent=(
-            zgrid[0] * 1e6,  # + 40
-            zgrid[-1] * 1e6,  # - 20
-            rgrid[0] * 1e6,
-            rgrid[-1] * 1e6,  # - 15,
-        ),
-        cbar=True,
-        vmin=-2,
-        vmax=2,
-        hslice_val=0.0,  # do a 1D slice through the middle of the simulation box
-    )
-    fig.savefig('check_laser.png')
+    if check_laser:
+        # Get the fields in the half-plane theta=0 (Sum mode 0 and mode 1)
+        # (collective call: every rank takes part, only rank 0 gets the grids)
+        gathered_grids = [sim.comm.gather_grid(sim.fld.interp[m]) for m in range(Nm)]
+
+        if sim.comm.rank == 0:
+            # Plotting imports are only needed here, so the other MPI ranks
+            # skip the matplotlib start-up entirely
+            import matplotlib
+            matplotlib.use('Agg')
+            from matplotlib import pyplot
+            from sliceplots import Plot2D
+
+            rgrid = gathered_grids[0].r
+            zgrid = gathered_grids[0].z
+
+            # Check the Er field (single precision is plenty for plotting)
+            Er = gathered_grids[0].Er.T.real.astype(np.float32)
+
+            for m in range(1, Nm):
+                # There is a factor 2 here so as to comply with the convention in
+                # Lifschitz et al., which is also the convention adopted in Warp Circ
+                Er += 2 * gathered_grids[m].Er.T.real
+
+            # wavevector
+            k0 = 2 * np.pi / lambda0
+            # field amplitude
+            e0 = m_e * c ** 2 * k0 / e
+
+            fig = pyplot.figure(figsize=(8, 8))
+            Plot2D(
+                fig=fig,
+                arr2d=Er / e0,
+                h_axis=zgrid * 1e6,
+                v_axis=rgrid * 1e6,
+                zlabel=r"$E_r/E_0$",
+                xlabel=r"$z \;(\mu m)$",
+                ylabel=r"$r \;(\mu m)$",
+                extent=(
+                    zgrid[0] * 1e6,  # + 40
+                    zgrid[-1] * 1e6,  # - 20
+                    rgrid[0] * 1e6,
+                    rgrid[-1] * 1e6,  # - 15,
+                ),
+                cbar=True,
+                vmin=-2,
+                vmax=2,
+                hslice_val=0.0,  # do a 1D slice through the middle of the simulation box
+            )
+            fig.savefig('check_laser.png')
 
     # Run the simulation
-    sim.step( N_step )
+    sim.step( N_step, show_progress=False )
     print('')
@@ -18,6 +18,7 @@ import sys
 import glob
 from typing import List, Optional, Tuple, Union, Callable, Iterable
 
+import numba
 import numpy as np
 import pandas as pd
 import sliceplots
@@ -268,6 +269,9 @@ def run_fbpic(job: Job) -> None:
     from fbpic.openpmd_diag import FieldDiagnostic, ParticleDiagnostic
 
     # The density profile
+    ramp_start = job.sp.ramp_start
+    inv_ramp_length = 1.0 / job.sp.ramp_length
+
     def dens_func(z: np.ndarray, r: np.ndarray) -> np.ndarray:
         """Returns relative density at position z and r.
 
@@ -275,18 +279,11 @@ def run_fbpic(job: Job) -> None:
         :param r: radial positions, 1d array
         :return: a 1d array ``n`` containing the density (between 0 and 1) at the given positions (z, r)
         """
-        # Allocate relative density
-        n = np.ones_like(z)
-
-        # Make linear ramp
-        n = np.where(
-            z < job.sp.ramp_start + job.sp.ramp_length,
-            (z - job.sp.ramp_start) / job.sp.ramp_length,
-            n,
-        )
+        # Make linear ramp, allocating the relative density only once
+        n = (z - ramp_start) * inv_ramp_length
 
-        # Supress density before the ramp
-        n = np.where(z < job.sp.ramp_start, 0.0, n)
+        # Supress density before the ramp, saturate after it
+        np.clip(n, 0.0, 1.0, out=n)
 
         return n
 
@@ -349,7 +346,7 @@ def run_fbpic(job: Job) -> None:
         boundaries={"z":"open", "r":"reflective"},
         n_order=-1,
         use_cuda=True,
-        verbose_level=2,
+        verbose_level=1,
     )
 
     # Create a Gaussian laser profile
@@ -460,6 +457,43 @@ def electric_field_amplitude_norm(lambda0=0.8e-6):
     return e0
 
 
+@numba.njit(parallel=True, cache=True)
+def _energy_histogram(
+        ux: np.ndarray, uy: np.ndarray, uz: np.ndarray, w: np.ndarray,
+        energy_min: float, energy_max: float, nbins: int,
+) -> np.ndarray:
+    """
+    Fused equivalent of ``np.histogram(mc2 * gamma, bins=nbins, range=(energy_min, energy_max), weights=w)``.
+    Each thread bins its own chunk of particles, and the partial histograms are summed at the end,
+    so no temporary ``energy`` array is allocated.
+
+    :param ux: particle momenta along x, normalized to m_e c
+    :param uy: particle momenta along y, normalized to m_e c
+    :param uz: particle momenta along z, normalized to m_e c
+    :param w: particle weights
+    :param energy_min: lower energy threshold (MeV)
+    :param energy_max: upper energy threshold (MeV)
+    :param nbins: number of equally-sized energy bins
+    :return: histogram values
+    """
+    nparticles = ux.shape[0]
+    nchunks = numba.get_num_threads()
+    chunk_size = (nparticles + nchunks - 1) // nchunks
+    inv_bin_size = nbins / (energy_max - energy_min)
+
+    partial_hist = np.zeros((nchunks, nbins))
+    for chunk in numba.prange(nchunks):
+        for i in range(chunk * chunk_size, min((chunk + 1) * chunk_size, nparticles)):
+            energy = mc2 * math.sqrt(1.0 + ux[i] ** 2 + uy[i] ** 2 + uz[i] ** 2)
+            if not energy_min <= energy <= energy_max:
+                continue
+            # the last bin also contains its right edge, as in ``np.histogram``
+            b = min(int((energy - energy_min) * inv_bin_size), nbins - 1)
+            partial_hist[chunk, b] += w[i]
+
+    return partial_hist.sum(axis=0)
+
+
 def particle_energy_histogram(
         tseries: OpenPMDTimeSeries, it: int,
         energy_min=1, energy_max=800, delta_energy=1, cutoff=1,  # CHANGEME
@@ -479,15 +513,13 @@ def particle_energy_histogram(
     energy_bins = np.linspace(start=energy_min, stop=energy_max, num=nbins + 1)
 
     ux, uy, uz, w = tseries.get_particle(["ux", "uy", "uz", "w"], iteration=it)
-    energy = mc2 * np.sqrt(1 + ux ** 2 + uy ** 2 + uz ** 2)
+    hist = _energy_histogram(ux, uy, uz, w, float(energy_min), float(energy_max), int(nbins))
 
     # Explanation of weights:
     #     1. convert electron charge from C to pC (factor 1e12)
     #     2. multiply by weight w to get real number of electrons
     #     3. divide by energy bin size delta_energy to get charge / MeV
-    hist, _ = np.histogram(
-        energy, bins=energy_bins, weights=q_e * 1e12 / delta_energy * w
-    )
+    hist *= q_e * 1e12 / delta_energy
 
     # cut off histogram
     np.clip(hist, a_min=None, a_max=cutoff, out=hist)